@@ -1,11 +1,15 @@
 # coding=utf-8
 """Tests that verify that images served by Pulp can be pulled."""
 import contextlib
+import json
 import requests
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin
+from requests.adapters import HTTPAdapter
 
-from pulp_smash import api, cli, config, exceptions
+from pulp_smash import cli, config, exceptions
 from pulp_smash.pulp3.bindings import monitor_task
 from pulp_smash.pulp3.utils import (
     delete_orphans,
@@ -15,7 +19,6 @@ from pulp_smash.pulp3.utils import (
 )
 
 from pulp_container.tests.functional.utils import (
-    core_client,
     gen_container_client,
     gen_container_remote,
     get_docker_hub_remote_blobsums,
@@ -26,6 +29,7 @@ from pulp_container.tests.functional.constants import (
     CONTAINER_CONTENT_NAME,
     REPO_UPSTREAM_NAME,
     REPO_UPSTREAM_TAG,
+    REGISTRY_V2_FEED_URL,
 )
 from pulp_container.constants import MEDIA_TYPE
 
@@ -37,18 +41,222 @@ from pulpcore.client.pulp_container import (
     RepositoriesContainerApi,
     RemotesContainerApi,
 )
-from pulpcore.client.pulpcore import ArtifactsApi
 
+MANIFEST_MEDIA_TYPES = (
+    MEDIA_TYPE.MANIFEST_V2,
+    MEDIA_TYPE.MANIFEST_LIST,
+    MEDIA_TYPE.MANIFEST_OCI,
+    MEDIA_TYPE.INDEX_OCI,
+)
+"""Media types accepted when the digest of a manifest is compared with remote registry."""
 
-class PullContentTestCase(unittest.TestCase):
-    """Verify whether images served by Pulp can be pulled."""
+READ_CHUNK_SIZE = 128 * 1024
+"""The number of bytes read at once from a streamed response body."""
+
+UPSTREAM_REPOSITORY_URL = "{}/v2/library/{}".format(REGISTRY_V2_FEED_URL, REPO_UPSTREAM_NAME)
+"""The URL of the upstream repository on remote registry."""
+
+DEFAULT_TOKEN_EXPIRES_IN = 60
+"""The lifetime of a Bearer token in seconds if the token server does not specify it."""
+
+TOKEN_EXPIRY_MARGIN = 10
+"""The number of seconds before expiration at which a cached Bearer token is not used anymore."""
+
+_bearer_tokens = {}
+"""Bearer tokens and the times at which they expire, cached by the URL of a repository."""
+
+
+def _run_cleanups(teardown_cleanups):
+    """Call the registered cleanup functions.
+
+    The cleanups do not depend on each other, because Pulp unsets references to deleted
+    repositories and remotes and each pulled image is removed by a single cleanup, so they
+    are called concurrently.
+    """
+    with ThreadPoolExecutor(max_workers=len(teardown_cleanups) or 1) as executor:
+        futures = [
+            executor.submit(cleanup_function, args)
+            for cleanup_function, args in reversed(teardown_cleanups)
+        ]
+    for future in futures:
+        future.result()
+
+
+def _read_body(response):
+    """Read the body of a streamed response in chunks of READ_CHUNK_SIZE bytes."""
+    body = bytearray()
+    for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+        body.extend(chunk)
+    return bytes(body)
+
+
+def _request_bearer_token(url, authenticate_header, http=requests):
+    """Request a Bearer token for a repository from the token server and cache it.
+
+    :param url: The URL of a repository in a registry, e.g. ``https://<registry>/v2/<name>``.
+    :param authenticate_header: The Www-Authenticate header returned by the registry.
+    :param http: An object sending HTTP requests, e.g. a :class:`requests.Session`.
+    :returns: The Bearer token.
+    """
+    queries = AuthenticationHeaderQueries(authenticate_header)
+    token_response = http.get(
+        queries.realm,
+        params={"service": queries.service, "scope": queries.scope},
+        stream=True,
+    )
+    token_response.raise_for_status()
+    content = json.loads(_read_body(token_response))
+    expires_in = content.get("expires_in", DEFAULT_TOKEN_EXPIRES_IN)
+    _bearer_tokens[url] = (content["token"], time.monotonic() + expires_in - TOKEN_EXPIRY_MARGIN)
+    return content["token"]
+
+
+def _get_cached_bearer_token(url):
+    """Return a cached Bearer token for a repository, or ``None`` if it is missing or expiring."""
+    token, expires_at = _bearer_tokens.get(url, (None, 0))
+    if time.monotonic() < expires_at:
+        return token
+    return None
+
+
+def _head_manifest_digest(url, tag, http=requests):
+    """Return the digest of a manifest retrieved by a HEAD request.
+
+    A cached Bearer token is sent along if there is one for the repository. A new token is
+    requested from the token server if the registry asks for it.
+
+    :param url: The URL of a repository in a registry, e.g. ``https://<registry>/v2/<name>``.
+    :param tag: The tag of the manifest.
+    :param http: An object sending HTTP requests, e.g. a :class:`requests.Session`.
+    :returns: The value of the Docker-Content-Digest header.
+    """
+    manifest_url = "{}/manifests/{}".format(url, tag)
+    headers = {"Accept": ",".join(MANIFEST_MEDIA_TYPES)}
+
+    token = _get_cached_bearer_token(url)
+    auth = BearerTokenAuth(token) if token else None
+    response = http.head(manifest_url, auth=auth, headers=headers)
+    if response.status_code == 401:
+        token = _request_bearer_token(url, response.headers["Www-Authenticate"], http=http)
+        response = http.head(manifest_url, auth=BearerTokenAuth(token), headers=headers)
+    response.raise_for_status()
+    return response.headers["Docker-Content-Digest"]
+
+
+def _wait_for_all(async_results):
+    """Wait for all API calls made with ``async_req=True`` to finish.
+
+    :param async_results: The asynchronous results of the API calls.
+    :returns: A tuple of (results, error). Results of failed calls are ``None`` and error is the
+        first exception raised by a call, or ``None`` if all calls succeeded.
+    """
+    results, error = [], None
+    for async_result in async_results:
+        try:
+            results.append(async_result.get())
+        except Exception as exc:
+            results.append(None)
+            error = error or exc
+    return results, error
+
+
+def _count_downloaded_blobs(repo):
+    """Return the number of blobs in the latest version of a repository that have an artifact."""
+    blobs = get_content(repo.to_dict())[CONTAINER_CONTENT_NAME]
+    return sum(1 for blob in blobs if blob["artifact"])
+
+
+def _create_synced_fixture(policy, teardown_cleanups):
+    """Create a synced repository served by two distributions.
+
+    The repository and the remote, and later the two distributions, are created at the same
+    time by the two pool threads of the API client.
+
+    1. Create a repository.
+    2. Create a remote pointing to external registry with the given policy.
+    3. Sync the repository using the remote and re-read the repo data.
+    4. Create a container distribution to serve the repository
+    5. Create another container distribution to the serve the repository version
+
+    Cleanups of the created objects are appended to ``teardown_cleanups``, even if another
+    concurrent call fails.
+
+    :param policy: The download policy of the remote.
+    :param teardown_cleanups: A list of (function, argument) pairs to call on teardown.
+    :returns: A tuple of (repo, distribution_with_repo, distribution_with_repo_version, remote).
+    """
+    client_api = gen_container_client(pool_threads=2)
+    repositories_api = RepositoriesContainerApi(client_api)
+    remotes_api = RemotesContainerApi(client_api)
+    distributions_api = DistributionsContainerApi(client_api)
+
+    # Step 1. and 2.
+    repo_request = repositories_api.create(
+        ContainerContainerRepository(**gen_repo()), async_req=True
+    )
+    remote_request = remotes_api.create(gen_container_remote(policy=policy), async_req=True)
+
+    (_repo, remote), error = _wait_for_all([repo_request, remote_request])
+    if _repo is not None:
+        teardown_cleanups.append((repositories_api.delete, _repo.pulp_href))
+    if remote is not None:
+        teardown_cleanups.append((remotes_api.delete, remote.pulp_href))
+    if error is not None:
+        raise error
+
+    # Step 3
+    sync_data = RepositorySyncURL(remote=remote.pulp_href)
+    sync_response = repositories_api.sync(_repo.pulp_href, sync_data)
+    monitor_task(sync_response.task)
+    repo = repositories_api.read(_repo.pulp_href)
+
+    # Step 4. and 5.
+    distribution_with_repo_request = distributions_api.create(
+        ContainerContainerDistribution(**gen_distribution(repository=repo.pulp_href)),
+        async_req=True,
+    )
+    distribution_with_repo_version_request = distributions_api.create(
+        ContainerContainerDistribution(
+            **gen_distribution(repository_version=repo.latest_version_href)
+        ),
+        async_req=True,
+    )
+
+    distribution_responses, error = _wait_for_all(
+        [distribution_with_repo_request, distribution_with_repo_version_request]
+    )
+    distributions = []
+    for distribution_response in distribution_responses:
+        distribution = None
+        if distribution_response is not None:
+            try:
+                created_resources = monitor_task(distribution_response.task).created_resources
+                teardown_cleanups.append((distributions_api.delete, created_resources[0]))
+                distribution = distributions_api.read(created_resources[0])
+            except Exception as exc:
+                error = error or exc
+        distributions.append(distribution)
+    if error is not None:
+        raise error
+    distribution_with_repo, distribution_with_repo_version = distributions
+
+    return repo, distribution_with_repo, distribution_with_repo_version, remote
+
+
+class _PullMixin:
+    """Verify whether images served by Pulp can be pulled.
+
+    Subclasses set ``policy`` to the download policy of the remote used for the sync.
+    """
+
+    policy = None
 
     @classmethod
     def setUpClass(cls):
         """Create class-wide variables.
 
         1. Create a repository.
-        2. Create a remote pointing to external registry.
+        2. Create a remote pointing to external registry with the policy of the test case.
         3. Sync the repository using the remote and re-read the repo data.
         4. Create a container distribution to serve the repository
         5. Create another container distribution to the serve the repository version
@@ -59,64 +267,58 @@ class PullContentTestCase(unittest.TestCase):
         """
         cls.cfg = config.get_config()
 
-        cls.client = api.Client(cls.cfg, api.code_handler)
-        client_api = gen_container_client()
-        cls.repositories_api = RepositoriesContainerApi(client_api)
-        cls.remotes_api = RemotesContainerApi(client_api)
-        cls.distributions_api = DistributionsContainerApi(client_api)
-
         cls.teardown_cleanups = []
 
+        # keep connections alive across the token handshakes of raw registry requests
+        cls.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=0)
+        cls.http.mount("https://", adapter)
+        cls.http.mount("http://", adapter)
+        cls.teardown_cleanups.append((requests.Session.close, cls.http))
+
         with contextlib.ExitStack() as stack:
             # ensure tearDownClass runs if an error occurs here
             stack.callback(cls.tearDownClass)
 
-            # Step 1
-            _repo = cls.repositories_api.create(ContainerContainerRepository(**gen_repo()))
-            cls.teardown_cleanups.append((cls.repositories_api.delete, _repo.pulp_href))
-
-            # Step 2
-            cls.remote = cls.remotes_api.create(gen_container_remote())
-            cls.teardown_cleanups.append((cls.remotes_api.delete, cls.remote.pulp_href))
-
-            # Step 3
-            sync_data = RepositorySyncURL(remote=cls.remote.pulp_href)
-            sync_response = cls.repositories_api.sync(_repo.pulp_href, sync_data)
-            monitor_task(sync_response.task)
-            cls.repo = cls.repositories_api.read(_repo.pulp_href)
-
-            # Step 4.
-            distribution_response = cls.distributions_api.create(
-                ContainerContainerDistribution(**gen_distribution(repository=cls.repo.pulp_href))
+            (
+                cls.repo,
+                cls.distribution_with_repo,
+                cls.distribution_with_repo_version,
+                cls.remote,
+            ) = _create_synced_fixture(cls.policy, cls.teardown_cleanups)
+
+            cls.base_url = cls.cfg.get_base_url()
+            cls.local_repo_url = urljoin(cls.base_url, cls.distribution_with_repo.base_path)
+            cls.local_repo_registry_url = urljoin(
+                cls.base_url, "/v2/{}".format(cls.distribution_with_repo.base_path)
             )
-            created_resources = monitor_task(distribution_response.task).created_resources
-            distribution = cls.distributions_api.read(created_resources[0])
-            cls.distribution_with_repo = cls.distributions_api.read(distribution.pulp_href)
-            cls.teardown_cleanups.append(
-                (cls.distributions_api.delete, cls.distribution_with_repo.pulp_href)
+            cls.local_version_registry_url = urljoin(
+                cls.base_url, "/v2/{}".format(cls.distribution_with_repo_version.base_path)
             )
 
-            # Step 5.
-            distribution_response = cls.distributions_api.create(
-                ContainerContainerDistribution(
-                    **gen_distribution(repository_version=cls.repo.latest_version_href)
-                )
-            )
-            created_resources = monitor_task(distribution_response.task).created_resources
-            distribution = cls.distributions_api.read(created_resources[0])
-            cls.distribution_with_repo_version = cls.distributions_api.read(distribution.pulp_href)
-            cls.teardown_cleanups.append(
-                (cls.distributions_api.delete, cls.distribution_with_repo_version.pulp_href)
-            )
+            cls._registry = cli.RegistryClient(cls.cfg)
+            cls._skip_reason = None
+            try:
+                cls._registry.raise_if_unsupported(unittest.SkipTest, "Test requires podman/docker")
+            except unittest.SkipTest as exc:
+                cls._skip_reason = str(exc)
+
+            cls._set_up_class_extra()
 
             # remove callback if everything goes well
             stack.pop_all()
 
+    @classmethod
+    def _set_up_class_extra(cls):
+        """Create class-wide variables specific to a subclass.
+
+        It is called at the end of setUpClass, so tearDownClass runs if an error occurs here.
+        """
+
     @classmethod
     def tearDownClass(cls):
         """Clean class-wide variable."""
-        for cleanup_function, args in reversed(cls.teardown_cleanups):
-            cleanup_function(args)
+        _run_cleanups(cls.teardown_cleanups)
 
     def test_api_returns_same_checksum(self):
         """Verify that pulp serves image with the same checksum of remote.
@@ -126,45 +328,18 @@ class PullContentTestCase(unittest.TestCase):
         3. Compare the checksums.
         """
         # Get local checksums for content synced from remote registy
-        checksums = [
+        checksums = {
             content["digest"]
             for content in get_content(self.repo.to_dict())[CONTAINER_CONTENT_NAME]
-        ]
+        }
 
         # Assert that at least one layer is synced from remote:latest
         # and the checksum matched with remote
-        self.assertTrue(
-            any([result["blobSum"] in checksums for result in get_docker_hub_remote_blobsums()]),
+        self.assertFalse(
+            checksums.isdisjoint(get_docker_hub_remote_blobsums()),
             "Cannot find a matching layer on remote registry.",
         )
 
-    def test_api_performes_schema_conversion(self):
-        """Verify pull via token with accepted content type."""
-        image_path = "/v2/{}/manifests/{}".format(self.distribution_with_repo.base_path, "latest")
-        latest_image_url = urljoin(self.cfg.get_base_url(), image_path)
-
-        with self.assertRaises(requests.HTTPError) as cm:
-            self.client.get(latest_image_url, headers={"Accept": MEDIA_TYPE.MANIFEST_V1})
-
-        content_response = cm.exception.response
-        self.assertEqual(content_response.status_code, 401)
-
-        authenticate_header = content_response.headers["Www-Authenticate"]
-        queries = AuthenticationHeaderQueries(authenticate_header)
-        content_response = requests.get(
-            queries.realm, params={"service": queries.service, "scope": queries.scope}
-        )
-        content_response.raise_for_status()
-        token = content_response.json()["token"]
-        content_response = requests.get(
-            latest_image_url,
-            auth=BearerTokenAuth(token),
-            headers={"Accept": MEDIA_TYPE.MANIFEST_V1},
-        )
-        content_response.raise_for_status()
-        base_content_type = content_response.headers["Content-Type"].split(";")[0]
-        self.assertIn(base_content_type, {MEDIA_TYPE.MANIFEST_V1, MEDIA_TYPE.MANIFEST_V1_SIGNED})
-
     def test_pull_image_from_repository(self):
         """Verify that a client can pull the image from Pulp.
 
@@ -173,69 +348,81 @@ class PullContentTestCase(unittest.TestCase):
         3. Verify both images has the same checksum.
         4. Ensure image is deleted after the test.
         """
-        registry = cli.RegistryClient(self.cfg)
-        registry.raise_if_unsupported(unittest.SkipTest, "Test requires podman/docker")
+        if self._skip_reason:
+            self.skipTest(self._skip_reason)
+        registry = self._registry
 
-        local_url = urljoin(self.cfg.get_base_url(), self.distribution_with_repo.base_path)
+        local_url = self.local_repo_url
 
         registry.pull(local_url)
         self.teardown_cleanups.append((registry.rmi, local_url))
         local_image = registry.inspect(local_url)
 
+        # pull from Pulp first, the layers of the upstream image would be reused otherwise
         registry.pull(REPO_UPSTREAM_NAME)
         remote_image = registry.inspect(REPO_UPSTREAM_NAME)
+        registry.rmi(REPO_UPSTREAM_NAME)
 
         self.assertEqual(local_image[0]["Id"], remote_image[0]["Id"])
-        registry.rmi(REPO_UPSTREAM_NAME)
 
     def test_pull_image_from_repository_version(self):
-        """Verify that a client can pull the image from Pulp.
+        """Verify that Pulp serves the same manifest as the remote registry.
 
-        1. Using the RegistryClient pull the image from Pulp.
-        2. Pull the same image from remote registry.
-        3. Verify both images has the same checksum.
-        4. Ensure image is deleted after the test.
+        1. Fetch the digest of the latest manifest served by the repository version.
+        2. Fetch the digest of the latest manifest from remote registry.
+        3. Verify both digests are the same.
         """
-        registry = cli.RegistryClient(self.cfg)
-        registry.raise_if_unsupported(unittest.SkipTest, "Test requires podman/docker")
+        local_digest = _head_manifest_digest(
+            self.local_version_registry_url, "latest", http=self.http
+        )
+        remote_digest = _head_manifest_digest(UPSTREAM_REPOSITORY_URL, "latest", http=self.http)
 
-        local_url = urljoin(self.cfg.get_base_url(), self.distribution_with_repo_version.base_path)
+        self.assertEqual(local_digest, remote_digest)
 
-        registry.pull(local_url)
-        self.teardown_cleanups.append((registry.rmi, local_url))
-        local_image = registry.inspect(local_url)
+    def test_pull_image_with_tag(self):
+        """Verify that Pulp serves the same manifest as the remote registry with a tag.
 
-        registry.pull(REPO_UPSTREAM_NAME)
-        remote_image = registry.inspect(REPO_UPSTREAM_NAME)
+        1. Fetch the digest of the manifest served by the repository for a tag.
+        2. Fetch the digest of the manifest for the same tag from remote registry.
+        3. Verify both digests are the same.
+        """
+        tag = REPO_UPSTREAM_TAG.lstrip(":")
+        local_digest = _head_manifest_digest(self.local_repo_registry_url, tag, http=self.http)
+        remote_digest = _head_manifest_digest(UPSTREAM_REPOSITORY_URL, tag, http=self.http)
 
-        self.assertEqual(local_image[0]["Id"], remote_image[0]["Id"])
-        registry.rmi(REPO_UPSTREAM_NAME)
+        self.assertEqual(local_digest, remote_digest)
 
-    def test_pull_image_with_tag(self):
-        """Verify that a client can pull the image from Pulp with a tag.
 
-        1. Using the RegistryClient pull the image from Pulp specifying a tag.
-        2. Pull the same image and same tag from remote registry.
-        3. Verify both images has the same checksum.
-        4. Ensure image is deleted after the test.
-        """
-        registry = cli.RegistryClient(self.cfg)
-        registry.raise_if_unsupported(unittest.SkipTest, "Test requires podman/docker")
+class PullContentTestCase(_PullMixin, unittest.TestCase):
+    """Verify whether images served by Pulp can be pulled."""
 
-        local_url = (
-            urljoin(self.cfg.get_base_url(), self.distribution_with_repo.base_path)
-            + REPO_UPSTREAM_TAG
-        )
+    policy = "immediate"
 
-        registry.pull(local_url)
-        self.teardown_cleanups.append((registry.rmi, local_url))
-        local_image = registry.inspect(local_url)
+    def test_api_performes_schema_conversion(self):
+        """Verify pull via token with accepted content type."""
+        latest_image_url = "{}/manifests/{}".format(self.local_repo_registry_url, "latest")
 
-        registry.pull(REPO_UPSTREAM_NAME + REPO_UPSTREAM_TAG)
-        self.teardown_cleanups.append((registry.rmi, REPO_UPSTREAM_NAME + REPO_UPSTREAM_TAG))
-        remote_image = registry.inspect(REPO_UPSTREAM_NAME + REPO_UPSTREAM_TAG)
+        content_response = self.http.get(
+            latest_image_url, headers={"Accept": MEDIA_TYPE.MANIFEST_V1}
+        )
+        self.assertEqual(content_response.status_code, 401)
 
-        self.assertEqual(local_image[0]["Id"], remote_image[0]["Id"])
+        authenticate_header = content_response.headers["Www-Authenticate"]
+        token = _request_bearer_token(
+            self.local_repo_registry_url, authenticate_header, http=self.http
+        )
+        # a HEAD request is not enough, the registry converts the schema only when serving GET
+        content_response = self.http.get(
+            latest_image_url,
+            auth=BearerTokenAuth(token),
+            headers={"Accept": MEDIA_TYPE.MANIFEST_V1},
+            stream=True,
+        )
+        content_response.raise_for_status()
+        # consume the body to release the connection back to the pool
+        _read_body(content_response)
+        base_content_type = content_response.headers["Content-Type"].split(";")[0]
+        self.assertIn(base_content_type, {MEDIA_TYPE.MANIFEST_V1, MEDIA_TYPE.MANIFEST_V1_SIGNED})
 
     def test_pull_nonexistent_image(self):
         """Verify that a client cannot pull nonexistent image from Pulp.
@@ -243,190 +430,43 @@ class PullContentTestCase(unittest.TestCase):
         1. Using the RegistryClient try to pull nonexistent image from Pulp.
         2. Assert that error is occurred and nothing has been pulled.
         """
-        registry = cli.RegistryClient(self.cfg)
-        registry.raise_if_unsupported(unittest.SkipTest, "Test requires podman/docker")
+        if self._skip_reason:
+            self.skipTest(self._skip_reason)
+        registry = self._registry
 
-        local_url = urljoin(self.cfg.get_base_url(), "inexistentimagename")
+        local_url = urljoin(self.base_url, "inexistentimagename")
         with self.assertRaises(exceptions.CalledProcessError):
             registry.pull(local_url)
 
 
-class PullOnDemandContentTestCase(unittest.TestCase):
+class PullOnDemandContentTestCase(_PullMixin, unittest.TestCase):
     """Verify whether on-demand served images by Pulp can be pulled."""
 
+    policy = "on_demand"
+
     @classmethod
     def setUpClass(cls):
-        """Create class-wide variables and delete orphans.
+        """Delete orphans and create class-wide variables.
 
-        1. Create a repository.
-        2. Create a remote pointing to external registry with policy=on_demand.
-        3. Sync the repository using the remote and re-read the repo data.
-        4. Create a container distribution to serve the repository
-        5. Create another container distribution to the serve the repository version
-
-        This tests targets the following issue:
-
-        * `Pulp #4460 <https://pulp.plan.io/issues/4460>`_
+        Orphaned blobs left by other tests would be reused by the sync along with their
+        artifacts, so that pulling the image would not download anything through Pulp.
         """
-        cls.cfg = config.get_config()
-
-        client_api = gen_container_client()
-        cls.repositories_api = RepositoriesContainerApi(client_api)
-        cls.remotes_api = RemotesContainerApi(client_api)
-        cls.distributions_api = DistributionsContainerApi(client_api)
-
-        cls.teardown_cleanups = []
-
         delete_orphans()
 
-        with contextlib.ExitStack() as stack:
-            # ensure tearDownClass runs if an error occurs here
-            stack.callback(cls.tearDownClass)
-
-            # Step 1
-            _repo = cls.repositories_api.create(ContainerContainerRepository(**gen_repo()))
-            cls.teardown_cleanups.append((cls.repositories_api.delete, _repo.pulp_href))
-
-            # Step 2
-            cls.remote = cls.remotes_api.create(gen_container_remote(policy="on_demand"))
-            cls.teardown_cleanups.append((cls.remotes_api.delete, cls.remote.pulp_href))
-
-            # Step 3
-            sync_data = RepositorySyncURL(remote=cls.remote.pulp_href)
-            sync_response = cls.repositories_api.sync(_repo.pulp_href, sync_data)
-            monitor_task(sync_response.task)
-
-            cls.repo = cls.repositories_api.read(_repo.pulp_href)
-            cls.artifacts_api = ArtifactsApi(core_client)
-            cls.artifact_count = cls.artifacts_api.list().count
-
-            # Step 4.
-            distribution_response = cls.distributions_api.create(
-                ContainerContainerDistribution(**gen_distribution(repository=cls.repo.pulp_href))
-            )
-            created_resources = monitor_task(distribution_response.task).created_resources
-
-            distribution = cls.distributions_api.read(created_resources[0])
-            cls.distribution_with_repo = cls.distributions_api.read(distribution.pulp_href)
-            cls.teardown_cleanups.append(
-                (cls.distributions_api.delete, cls.distribution_with_repo.pulp_href)
-            )
-
-            # Step 5.
-            distribution_response = cls.distributions_api.create(
-                ContainerContainerDistribution(
-                    **gen_distribution(repository_version=cls.repo.latest_version_href)
-                )
-            )
-            created_resources = monitor_task(distribution_response.task).created_resources
-            distribution = cls.distributions_api.read(created_resources[0])
-            cls.distribution_with_repo_version = cls.distributions_api.read(distribution.pulp_href)
-            cls.teardown_cleanups.append(
-                (cls.distributions_api.delete, cls.distribution_with_repo_version.pulp_href)
-            )
-
-            # remove callback if everything goes well
-            stack.pop_all()
+        super().setUpClass()
 
     @classmethod
-    def tearDownClass(cls):
-        """Clean class-wide variable."""
-        for cleanup_function, args in reversed(cls.teardown_cleanups):
-            cleanup_function(args)
-
-    def test_api_returns_same_checksum(self):
-        """Verify that pulp serves image with the same checksum of remote.
-
-        1. Call pulp repository API and get the content_summary for repo.
-        2. Call dockerhub API and get blobsums for synced image.
-        3. Compare the checksums.
-        """
-        # Get local checksums for content synced from remote registy
-        checksums = [
-            content["digest"]
-            for content in get_content(self.repo.to_dict())[CONTAINER_CONTENT_NAME]
-        ]
-
-        # Assert that at least one layer is synced from remote:latest
-        # and the checksum matched with remote
-        self.assertTrue(
-            any([result["blobSum"] in checksums for result in get_docker_hub_remote_blobsums()]),
-            "Cannot find a matching layer on remote registry.",
-        )
+    def _set_up_class_extra(cls):
+        """Count the blobs downloaded by the sync."""
+        cls.downloaded_blob_count = _count_downloaded_blobs(cls.repo)
 
     def test_pull_image_from_repository(self):
         """Verify that a client can pull the image from Pulp (on-demand).
 
-        1. Using the RegistryClient pull the image from Pulp.
-        2. Pull the same image from remote registry.
-        3. Verify both images has the same checksum.
-        4. Verify that the number of artifacts in Pulp has increased.
-        5. Ensure image is deleted after the test.
-        """
-        registry = cli.RegistryClient(self.cfg)
-        registry.raise_if_unsupported(unittest.SkipTest, "Test requires podman/docker")
-
-        local_url = urljoin(self.cfg.get_base_url(), self.distribution_with_repo.base_path)
-
-        registry.pull(local_url)
-        self.teardown_cleanups.append((registry.rmi, local_url))
-        local_image = registry.inspect(local_url)
-
-        registry.pull(REPO_UPSTREAM_NAME)
-        remote_image = registry.inspect(REPO_UPSTREAM_NAME)
-
-        self.assertEqual(local_image[0]["Id"], remote_image[0]["Id"])
-
-        new_artifact_count = self.artifacts_api.list().count
-        self.assertGreater(new_artifact_count, self.artifact_count)
-
-        registry.rmi(REPO_UPSTREAM_NAME)
-
-    def test_pull_image_from_repository_version(self):
-        """Verify that a client can pull the image from Pulp (on-demand).
-
-        1. Using the RegistryClient pull the image from Pulp.
-        2. Pull the same image from remote registry.
-        3. Verify both images has the same checksum.
-        4. Ensure image is deleted after the test.
+        1. Pull the image from Pulp and compare it with the remote image.
+        2. Verify that the number of blobs in the repository with an artifact has increased.
         """
-        registry = cli.RegistryClient(self.cfg)
-        registry.raise_if_unsupported(unittest.SkipTest, "Test requires podman/docker")
-
-        local_url = urljoin(self.cfg.get_base_url(), self.distribution_with_repo_version.base_path)
+        super().test_pull_image_from_repository()
 
-        registry.pull(local_url)
-        self.teardown_cleanups.append((registry.rmi, local_url))
-        local_image = registry.inspect(local_url)
-
-        registry.pull(REPO_UPSTREAM_NAME)
-        remote_image = registry.inspect(REPO_UPSTREAM_NAME)
-
-        self.assertEqual(local_image[0]["Id"], remote_image[0]["Id"])
-        registry.rmi(REPO_UPSTREAM_NAME)
-
-    def test_pull_image_with_tag(self):
-        """Verify that a client can pull the image from Pulp with a tag (on-demand).
-
-        1. Using the RegistryClient pull the image from Pulp specifying a tag.
-        2. Pull the same image and same tag from remote registry.
-        3. Verify both images has the same checksum.
-        4. Ensure image is deleted after the test.
-        """
-        registry = cli.RegistryClient(self.cfg)
-        registry.raise_if_unsupported(unittest.SkipTest, "Test requires podman/docker")
-
-        local_url = (
-            urljoin(self.cfg.get_base_url(), self.distribution_with_repo.base_path)
-            + REPO_UPSTREAM_TAG
-        )
-
-        registry.pull(local_url)
-        self.teardown_cleanups.append((registry.rmi, local_url))
-        local_image = registry.inspect(local_url)
-
-        registry.pull(REPO_UPSTREAM_NAME + REPO_UPSTREAM_TAG)
-        self.teardown_cleanups.append((registry.rmi, REPO_UPSTREAM_NAME + REPO_UPSTREAM_TAG))
-        remote_image = registry.inspect(REPO_UPSTREAM_NAME + REPO_UPSTREAM_TAG)
-
-        self.assertEqual(local_image[0]["Id"], remote_image[0]["Id"])
+        new_downloaded_blob_count = _count_downloaded_blobs(self.repo)
+        self.assertGreater(new_downloaded_blob_count, self.downloaded_blob_count)
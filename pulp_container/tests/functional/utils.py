@@ -3,7 +3,7 @@
 import requests
 
 from requests.auth import AuthBase
-from functools import partial
+from functools import lru_cache, partial
 from unittest import SkipTest
 from tempfile import NamedTemporaryFile
 
@@ -38,9 +38,12 @@ cfg = config.get_config()
 configuration = cfg.get_bindings_config()
 
 
-def gen_container_client():
-    """Return an OBJECT for container client."""
-    return ContainerApiClient(configuration)
+def gen_container_client(pool_threads=1):
+    """Return an OBJECT for container client.
+
+    :param pool_threads: The number of threads sending requests made with ``async_req=True``.
+    """
+    return ContainerApiClient(configuration, pool_threads=pool_threads)
 
 
 def gen_container_remote(url=REGISTRY_V2_FEED_URL, **kwargs):
@@ -51,8 +54,14 @@ def gen_container_remote(url=REGISTRY_V2_FEED_URL, **kwargs):
     return gen_remote(url, upstream_name=kwargs.pop("upstream_name", REPO_UPSTREAM_NAME), **kwargs)
 
 
+@lru_cache(maxsize=None)
 def get_docker_hub_remote_blobsums(upstream_name=REPO_UPSTREAM_NAME):
-    """Get remote blobsum list from dockerhub registry."""
+    """Get remote blobsums from dockerhub registry.
+
+    The result is cached per upstream name for the lifetime of the process.
+
+    :returns: A tuple with the blobsums of the layers of the latest manifest.
+    """
     token_url = (
         "https://auth.docker.io/token"
         "?service=registry.docker.io"
@@ -65,7 +74,7 @@ def get_docker_hub_remote_blobsums(upstream_name=REPO_UPSTREAM_NAME):
     blob_url = ("{0}/v2/library/{1}/manifests/latest").format(REGISTRY_V2_FEED_URL, upstream_name)
     response = requests.get(blob_url, headers={"Authorization": "Bearer " + token})
     response.raise_for_status()
-    return response.json()["fsLayers"]
+    return tuple(layer["blobSum"] for layer in response.json()["fsLayers"])
 
 
 def get_container_image_paths(repo, version_href=None):